@@ -4,15 +4,19 @@ Application to trigger camera frames and collect the timing of TTL sources durin
 This version relies on a LabJack U3 device, but you can also run it with a dummy (emulator) device:
 python timestamper.py --dummy
 
+Digital inputs are sampled by the LabJack in stream mode (hardware clocked). To use software
+polling of the inputs instead, run with:
+python timestamper.py --poll
+
 TO DO:
 - ts_trigger_falling includes extra values at the beginning and end.
 - Add saving a temp file when stopping the system.
 - Allow running the software without u3 package. It fails on u3.BitDirWrite().
 
 DEBUG:
-trig = np.array(tsApp.timestamper.timestamps_trigger_rising)
+trig = np.array(tsApp.timestamper.timestamps_trigger_rising)  # In nanoseconds
 d = np.diff(trig)
-clf(); hist(d*1000)
+clf(); hist(d*1e-6)
 
 d = np.load('/tmp/test000_timestamps_20240506_230427.npz')
 for f in d.files: print(f'{f}: {d[f]}')
@@ -20,25 +24,40 @@ for f in d.files: print(f'{f}: {d[f]}')
 """
 
 import datetime
+import os
+import random
 import time
 import sys
+import threading
 from qtpy import QtWidgets, QtCore, QtGui
 import numpy as np
 try:
     import u3
 except ImportError:
     print('Could not import LabJack U3 module. You can only use a dummy device.')
+try:
+    import numba
+except ImportError:
+    numba = None  # Edge detection falls back to (slower) numpy operations
 
 
 DEBUG = False
 
 DEFAULT_TRIGGER_RATE = 20 # In Hz
-SAMPLING_PERIOD = 0.001  # In seconds
+SAMPLING_PERIOD = 0.001  # In seconds (only used when polling)
+UI_REFRESH_PERIOD = 0.033  # In seconds (GUI counters are updated at this rate)
+SCAN_FREQUENCY = 1000  # In Hz (hardware-clocked sampling when streaming)
+STREAM_CHANNEL_FIO_EIO = 193  # U3 special stream channel that returns the FIO/EIO digital states
+WAIT_SHORT_UNIT_NS = 128000  # In nanoseconds (duration of one unit of the U3 WaitShort command)
+MAX_DEVICE_PULSE_WIDTH = 0.5  # In seconds (longer trigger pulses are timed by the computer)
+REALTIME_PRIORITY = 20  # SCHED_FIFO priority of the sampling thread (Linux only)
 
 TRIGGER_PIN = 0
 DIGITAL_INPUT_PINS = [6]  # [6, 7]
 DIGITAL_INPUT_NAMES = ['sound']  # ['camera', 'sound']
 
+INITIAL_BUFFER_SIZE = 2**16  # Number of timestamps preallocated per buffer (grows as needed)
+
 BUTTON_COLORS = {'start': 'limegreen', 'stop': 'red'}
 MIN_WINDOW_WIDTH = 200
 
@@ -50,15 +69,32 @@ class DummyDevice:
         pass
 
     def getFeedback(self, *args):
-        pass
+        port_state = 0xFF * self.getFIOState()
+        return [{'FIO': port_state, 'EIO': 0, 'CIO': 0} for _ in args]
 
     def setFIOState(self, *args):
         pass
     
     def getFIOState(self, *args):
-        value = 1 if (np.random.rand(1)<0.001) else 0
+        value = 1 if (random.random()<0.001) else 0
         return value
 
+    def streamConfig(self, ScanFrequency=1000, SamplesPerPacket=25, **kwargs):
+        self.scan_frequency = ScanFrequency
+        self.samples_per_packet = SamplesPerPacket
+
+    def streamStart(self):
+        self.streaming = True
+
+    def streamStop(self):
+        self.streaming = False
+
+    def streamData(self, convert=True):
+        while self.streaming:
+            time.sleep(self.samples_per_packet / self.scan_frequency)
+            fio = 0xFF * (np.random.rand(self.samples_per_packet) < 0.001)
+            yield {'AIN193': [(int(value), 0) for value in fio], 'missed': 0}
+
     def close(self):
         pass
 
@@ -70,18 +106,125 @@ class DummyModule:
     def BitDirWrite(self, *args):
         pass
 
+    def PortStateRead(self, *args):
+        pass
+
+    def BitStateWrite(self, *args):
+        pass
+
+    def WaitShort(self, *args):
+        pass
+
+
+class TimestampBuffer:
+    """
+    Preallocated array of timestamps (integer nanoseconds) that doubles in size when full.
+    It can be indexed (and passed to numpy) like the array of stored values.
+    """
+    def __init__(self, size=INITIAL_BUFFER_SIZE, dtype=np.int64):
+        self.data = np.empty(size, dtype=dtype)
+        self.n_items = 0
+
+    def __len__(self):
+        return self.n_items
+
+    def __getitem__(self, key):
+        return self.values()[key]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array(self.values(), dtype=dtype, copy=copy)
+
+    def values(self):
+        """
+        Return a view (not a copy) of the stored timestamps.
+        """
+        return self.data[:self.n_items]
+
+    def seconds(self):
+        """
+        Return a copy of the stored timestamps converted to seconds.
+        """
+        return self.values() * 1e-9
+
+    def append(self, value):
+        if self.n_items == len(self.data):
+            self.grow(self.n_items + 1)
+        self.data[self.n_items] = value
+        self.n_items += 1
+
+    def extend(self, values):
+        n_new = len(values)
+        if self.n_items + n_new > len(self.data):
+            self.grow(self.n_items + n_new)
+        self.data[self.n_items:self.n_items+n_new] = values
+        self.n_items += n_new
+
+    def grow(self, min_size):
+        new_size = max(2 * len(self.data), min_size)
+        new_data = np.empty(new_size, dtype=self.data.dtype)
+        new_data[:self.n_items] = self.data[:self.n_items]  # Only copy the filled part
+        self.data = new_data
+
+
+def detect_edges_numpy(port_state, pin_numbers, state):
+    """
+    Find changes of the input pins on a sequence of port states.
+
+    Args:
+        port_state (np.ndarray): State of all digital lines (one bit per line) for each sample.
+        pin_numbers (np.ndarray): Line number of each input.
+        state (np.ndarray): State of each input before the first sample (updated in place).
+    Returns:
+        input_inds (np.ndarray): Input index of each change.
+        sample_inds (np.ndarray): Sample index of each change.
+        rising (np.ndarray): True for rising edges, False for falling edges.
+    """
+    samples = ((port_state >> pin_numbers[:, np.newaxis]) & 1).astype(np.int8)
+    edges = np.diff(samples, axis=1, prepend=state[:, np.newaxis].astype(np.int8))
+    input_inds, sample_inds = np.nonzero(edges)
+    state[:] = samples[:, -1]
+    return input_inds, sample_inds, edges[input_inds, sample_inds] > 0
+
+
+def detect_edges_loop(port_state, pin_numbers, state):
+    """
+    Same as detect_edges_numpy() but with explicit loops, to be compiled with numba.
+    """
+    n_max = len(port_state) * len(pin_numbers)
+    input_inds = np.empty(n_max, dtype=np.int64)
+    sample_inds = np.empty(n_max, dtype=np.int64)
+    rising = np.empty(n_max, dtype=np.bool_)
+    n_edges = 0
+    for sample_ind in range(len(port_state)):
+        for input_ind in range(len(pin_numbers)):
+            value = (port_state[sample_ind] >> pin_numbers[input_ind]) & 1
+            if value != state[input_ind]:
+                input_inds[n_edges] = input_ind
+                sample_inds[n_edges] = sample_ind
+                rising[n_edges] = (value == 1)
+                n_edges += 1
+                state[input_ind] = value
+    return input_inds[:n_edges], sample_inds[:n_edges], rising[:n_edges]
+
+
+if numba is not None:
+    detect_edges = numba.njit(cache=True, boundscheck=False)(detect_edges_loop)
+else:
+    detect_edges = detect_edges_numpy
+
 
 class TimeStamper:
     """
     Class to timestamp the camera frames and other TTL sources.
     """
     def __init__(self, triggerpin=TRIGGER_PIN, inputpins=DIGITAL_INPUT_PINS,
-                 inputnames=DIGITAL_INPUT_NAMES, dummy=False):
+                 inputnames=DIGITAL_INPUT_NAMES, dummy=False, streaming=True):
         """
         Initialize the Timestamper object.
         
         Args:
             pins (list): List of pins of LabJack to monitor as digital inputs.
+            streaming (bool): If True, sample inputs in stream mode. Otherwise use poll().
         """
         if dummy:
             self.device = DummyDevice()
@@ -91,25 +234,44 @@ class TimeStamper:
             self.u3module = u3
             
         self.device.getCalibrationData()
+        self.device_lock = threading.Lock()  # Commands may come from the GUI and sampling threads
         
-        # -- Set FIOs to digial and direction to input --
+        # -- Set FIOs to digial, set directions, and read initial state (one USB transaction) --
         self.trigger_pin = triggerpin
-        self.device.getFeedback(self.u3module.BitDirWrite(self.trigger_pin, 1))
         self.input_pins = inputpins
-        for ind in self.input_pins:
-            self.device.getFeedback(self.u3module.BitDirWrite(ind, 0))
-        # FIXME: setting self.state could be done in one line with getFeedback()
-        self.state = []
-        for ind, pin in enumerate(self.input_pins):
-            self.state.append(self.device.getFIOState(pin))
+        self.read_command = self.u3module.PortStateRead()
+        commands = ([self.u3module.BitDirWrite(self.trigger_pin, 1)] +
+                    [self.u3module.BitDirWrite(pin, 0) for pin in self.input_pins] +
+                    [self.read_command])
+        results = self.device.getFeedback(*commands)
+        self.pin_numbers = np.array(self.input_pins, dtype=np.uint16)
+        self.input_index = {pin: ind for ind, pin in enumerate(self.input_pins)}
+        self.input_mask = sum(1 << pin for pin in self.input_pins)
+        # State of the inputs, with one bit per line as in the FIO/EIO ports (used when polling)
+        self.port_state = self.read_port_state(results[-1])
+        # State of each input, as an array (used when streaming)
+        self.state = ((self.port_state >> self.pin_numbers) & 1).astype(np.uint8)
         self.input_names = inputnames
+
+        # -- Configure hardware-clocked sampling of all digital lines --
+        self.streaming = streaming
+        self.scan_frequency = SCAN_FREQUENCY
+        if self.streaming:
+            self.device.streamConfig(NumChannels=1, PChannels=[STREAM_CHANNEL_FIO_EIO],
+                                     NChannels=[31], Resolution=3,
+                                     ScanFrequency=self.scan_frequency)
+            # Run edge detection once so it gets compiled (if using numba) before sampling
+            detect_edges(np.zeros(1, dtype=np.uint16), self.pin_numbers, self.state.copy())
+        self.stream_start_ns = 0
+        self.stream_sample_count = 0
        
-        self.start_time = datetime.datetime.now()
+        self.start_time = datetime.datetime.now()  # Wall-clock time, for display and saving
+        self.start_time_ns = time.perf_counter_ns()  # Monotonic clock, for timestamps
         self.trigger_counter = 0
-        self.timestamps_trigger_rising = []
-        self.timestamps_trigger_falling = []
-        self.timestamps_rising = [list() for _ in self.input_pins]
-        self.timestamps_falling = [list() for _ in self.input_pins]
+        self.timestamps_trigger_rising = TimestampBuffer()
+        self.timestamps_trigger_falling = TimestampBuffer()
+        self.timestamps_rising = [TimestampBuffer() for _ in self.input_pins]
+        self.timestamps_falling = [TimestampBuffer() for _ in self.input_pins]
         
     def name_inputs(self, names):
         """
@@ -117,43 +279,128 @@ class TimeStamper:
         """
         self.inputNames = names
 
+    def elapsed_time_ns(self):
+        """
+        Return the time (in nanoseconds) since the start time, from the monotonic clock.
+        """
+        return time.perf_counter_ns() - self.start_time_ns
+
     def trigger(self, state):
         """
         Set state of trigger (True=on, False=off)
         """
-        self.device.setFIOState(self.trigger_pin, state)
-        timestamp = datetime.datetime.now()
-        timestamp_sec = (timestamp-self.start_time).total_seconds()
+        with self.device_lock:
+            self.device.setFIOState(self.trigger_pin, state)
+        timestamp_ns = self.elapsed_time_ns()
         if state:
-            self.timestamps_trigger_rising.append(timestamp_sec)
+            self.timestamps_trigger_rising.append(timestamp_ns)
             self.trigger_counter += 1
         else:
-            self.timestamps_trigger_falling.append(timestamp_sec)
+            self.timestamps_trigger_falling.append(timestamp_ns)
+
+    def trigger_pulse(self, width):
+        """
+        Send one trigger pulse in a single USB transaction, with its width timed by the device.
+        The width is rounded to units of WaitShort.
+
+        Args:
+            width (float): Duration of the pulse in seconds.
+        """
+        n_wait_units = int(round(width * 1e9 / WAIT_SHORT_UNIT_NS))
+        max_units = 255  # Largest value accepted by WaitShort
+        wait_units = [max_units] * (n_wait_units // max_units)
+        if n_wait_units % max_units:
+            wait_units.append(n_wait_units % max_units)
+        commands = ([self.u3module.BitStateWrite(self.trigger_pin, 1)] +
+                    [self.u3module.WaitShort(units) for units in wait_units] +
+                    [self.u3module.BitStateWrite(self.trigger_pin, 0)])
+        timestamp_ns = self.elapsed_time_ns()
+        with self.device_lock:
+            self.device.getFeedback(*commands)
+        self.timestamps_trigger_rising.append(timestamp_ns)
+        self.timestamps_trigger_falling.append(timestamp_ns + n_wait_units * WAIT_SHORT_UNIT_NS)
+        self.trigger_counter += 1
         
     def poll(self):
         """
         Poll the digital inputs and get a timestamp if there is a change.
         """
-        previousState = list(self.state)  # Copy the current state
-        for ind, pin in enumerate(self.input_pins):
-            self.state[ind] = self.device.getFIOState(pin)
-        if self.state != previousState:
-            timestamp = datetime.datetime.now()
-            timestamp_sec = (timestamp-self.start_time).total_seconds()
-            change_status = True
-            for ind, pin in enumerate(self.input_pins):
-                if self.state[ind] != previousState[ind]:
-                    if self.state[ind] == 1:
-                        self.timestamps_rising[ind].append(timestamp_sec)
-                    else:
-                        self.timestamps_falling[ind].append(timestamp_sec)
-                    if DEBUG:
-                        print(f'[{ind}:{self.state[ind]}] {timestamp_sec}')
-                        #print(self.timestamps_rising)
-                        #print(self.timestamps_falling)
-        else:
-            change_status = False
-        return change_status
+        # -- Read all inputs in a single USB transaction --
+        with self.device_lock:
+            result = self.device.getFeedback(self.read_command)[0]
+        new_state = self.read_port_state(result)
+        changed = new_state ^ self.port_state
+        if not changed:
+            return False
+        timestamp_ns = self.elapsed_time_ns()
+        while changed:
+            bit = changed & -changed  # Lowest line that changed
+            ind = self.input_index[bit.bit_length() - 1]
+            if new_state & bit:
+                self.timestamps_rising[ind].append(timestamp_ns)
+            else:
+                self.timestamps_falling[ind].append(timestamp_ns)
+            changed ^= bit
+        if DEBUG:
+            print(f'{new_state:016b} {timestamp_ns}')
+        self.port_state = new_state
+        return True
+
+    def read_port_state(self, result):
+        """
+        Combine the FIO and EIO bytes from PortStateRead and keep only the input lines.
+        """
+        return (result['FIO'] | (result['EIO'] << 8)) & self.input_mask
+
+    def start_stream(self):
+        """
+        Start hardware-clocked sampling of the digital inputs.
+        """
+        with self.device_lock:
+            self.device.streamStart()
+        self.stream_start_ns = self.elapsed_time_ns()
+        self.stream_sample_count = 0
+
+    def stop_stream(self):
+        """
+        Stop hardware-clocked sampling of the digital inputs.
+        """
+        with self.device_lock:
+            self.device.streamStop()
+
+    def stream(self):
+        """
+        Iterate over stream packets and yield True for each packet that contained a change.
+        """
+        for packet in self.device.streamData():
+            if packet is None:
+                yield False
+            else:
+                yield self.process_stream_packet(packet)
+
+    def process_stream_packet(self, packet):
+        """
+        Find changes on the digital inputs in one stream packet and timestamp them.
+        Timestamps are computed from the sample index and the scan frequency.
+        """
+        fio_eio = np.array(packet[f'AIN{STREAM_CHANNEL_FIO_EIO}'], dtype=np.uint16).reshape(-1, 2)
+        port_state = fio_eio[:, 0] | (fio_eio[:, 1] << 8)
+        self.stream_sample_count += packet['missed']
+        first_sample = self.stream_sample_count
+        self.stream_sample_count += len(port_state)
+        if not len(port_state):
+            return False
+        input_inds, sample_inds, rising = detect_edges(port_state, self.pin_numbers, self.state)
+        if not len(input_inds):
+            return False
+        ts = self.stream_start_ns + (first_sample + sample_inds) * 10**9 // self.scan_frequency
+        for ind in np.unique(input_inds):
+            this_input = (input_inds == ind)
+            self.timestamps_rising[ind].extend(ts[this_input & rising])
+            self.timestamps_falling[ind].extend(ts[this_input & ~rising])
+            if DEBUG:
+                print(f'[{ind}] {ts[this_input]}')
+        return True
     
     def close(self):
         """
@@ -161,16 +408,97 @@ class TimeStamper:
         """
         self.device.close()
 
+
+class SamplingThread(QtCore.QThread):
+    """
+    Thread that samples the digital inputs so the GUI event loop does not affect sampling.
+    """
+    def __init__(self, timestamper, parent=None):
+        super().__init__(parent)
+        self.timestamper = timestamper
+
+    def run(self):
+        self.set_realtime_scheduling()
+        if self.timestamper.streaming:
+            self.timestamper.start_stream()
+            for change_status in self.timestamper.stream():
+                if self.isInterruptionRequested():
+                    break
+            self.timestamper.stop_stream()
+        else:
+            while not self.isInterruptionRequested():
+                self.timestamper.poll()
+                time.sleep(SAMPLING_PERIOD)
+
+    def set_realtime_scheduling(self):
+        """
+        Use real-time (FIFO) scheduling for this thread if the OS allows it.
+        This is only available on Linux and requires CAP_SYS_NICE (or root).
+        """
+        if not hasattr(os, 'sched_setscheduler'):
+            return
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(REALTIME_PRIORITY))
+        except OSError as error:
+            if DEBUG:
+                print(f'Could not set real-time scheduling for the sampling thread: {error}')
+
+
+class TriggerThread(QtCore.QThread):
+    """
+    Thread that toggles the trigger output so device I/O does not run on the GUI thread.
+    Toggle times are scheduled from the monotonic clock to avoid accumulating timer rounding.
+    When streaming, each pulse is sent as one command and its width is timed by the device
+    (this is not done when polling, since the device stays busy for the whole pulse).
+    The thread finishes by itself after max_n_triggers triggers.
+    """
+    def __init__(self, timestamper, parent=None):
+        super().__init__(parent)
+        self.timestamper = timestamper
+        self.trigger_rate = DEFAULT_TRIGGER_RATE
+        self.max_n_triggers = None
+        self.interrupt_event = threading.Event()
+
+    def run(self):
+        self.interrupt_event.clear()
+        half_period = 0.5 / self.trigger_rate
+        half_period_ns = int(half_period * 1e9)
+        device_pulses = self.timestamper.streaming and (half_period <= MAX_DEVICE_PULSE_WIDTH)
+        trigger_state = False
+        next_toggle_ns = time.perf_counter_ns() + half_period_ns
+        while not self.isInterruptionRequested():
+            delay_ns = next_toggle_ns - time.perf_counter_ns()
+            if (delay_ns > 0) and self.interrupt_event.wait(delay_ns * 1e-9):
+                break
+            if device_pulses:
+                self.timestamper.trigger_pulse(half_period)
+                if self.timestamper.trigger_counter >= self.max_n_triggers:
+                    break
+                next_toggle_ns += 2 * half_period_ns
+            else:
+                trigger_state = not trigger_state
+                self.timestamper.trigger(trigger_state)
+                if (self.timestamper.trigger_counter >= self.max_n_triggers) and (not trigger_state):
+                    break
+                next_toggle_ns += half_period_ns
+
+    def stop(self):
+        """
+        Stop toggling the trigger and wait for the thread to finish.
+        """
+        self.requestInterruption()
+        self.interrupt_event.set()
+        self.wait()
+
         
 class TimeStamperApp(QtWidgets.QMainWindow):
-    def __init__(self, dummy=False):
+    def __init__(self, dummy=False, streaming=True):
         super().__init__()
 
         self.dummy = dummy
         self.polling = False
-        self.trigger_state = False
         self.max_n_triggers = None
-        self.timestamper = TimeStamper(dummy=dummy)
+        self.timestamper = TimeStamper(dummy=dummy, streaming=streaming)
         self.n_inputs = len(self.timestamper.input_pins)
         self.start_time = self.timestamper.start_time
         self.inputs = range(self.n_inputs)
@@ -178,16 +506,18 @@ class TimeStamperApp(QtWidgets.QMainWindow):
         self.counter_rising = []
         self.counter_falling = []
         
-        # -- Create polling timer --
-        self.timerPoll = QtCore.QTimer(self)
-        self.timerPoll.timeout.connect(self.poll)
-        self.timerPoll.setInterval(int(SAMPLING_PERIOD * 1000))  # Convert to milliseconds
-
-        # -- Create trigger timer --
-        self.timer_trigger = QtCore.QTimer(self)
-        self.timer_trigger.setTimerType(QtCore.Qt.PreciseTimer)
-        self.timer_trigger.timeout.connect(self.trigger)
-        self.set_trigger_timer_half_interval(DEFAULT_TRIGGER_RATE)
+        # -- Create sampling thread --
+        self.sampling_thread = SamplingThread(self.timestamper, self)
+
+        # -- Create timer to refresh the input counters (decoupled from sampling) --
+        self.timer_ui = QtCore.QTimer(self)
+        self.timer_ui.timeout.connect(self.update_input_counters)
+        self.timer_ui.timeout.connect(self.update_trigger_counter)
+        self.timer_ui.setInterval(int(UI_REFRESH_PERIOD * 1000))  # Convert to milliseconds
+
+        # -- Create trigger thread --
+        self.trigger_thread = TriggerThread(self.timestamper, self)
+        self.trigger_thread.finished.connect(self.trigger_finished)
         
         self.init_gui()
         self.stop_polling()
@@ -195,6 +525,7 @@ class TimeStamperApp(QtWidgets.QMainWindow):
     def init_gui(self):
         self.setWindowTitle('TimeStamper')
         self.settings = QtCore.QSettings('JaraLab', 'timestamper')
+        self.settings.setAtomicSyncRequired(False)  # Settings are small, skip temp file + rename
         geometry = self.settings.value('geometry')
         if geometry:
             self.restoreGeometry(geometry)
@@ -234,8 +565,16 @@ class TimeStamperApp(QtWidgets.QMainWindow):
         self.label_total_duration = QtWidgets.QLabel(f'<b>Total duration:</b>', self)
         self.label_trigger_counter = QtWidgets.QLabel(f'Trigger counter:', self)
         self.trigger_counter = QtWidgets.QLabel('0', self)
-        self.label_rising = QtWidgets.QLabel(f'Input rising counter:  0', self)
-        self.label_falling = QtWidgets.QLabel(f'Input falling counter:  0', self)
+        self.label_rising = QtWidgets.QLabel(f'Input rising counter:', self)
+        self.rising_counter = QtWidgets.QLabel('0', self)
+        self.rising_last_ts = QtWidgets.QLabel('', self)
+        self.label_falling = QtWidgets.QLabel(f'Input falling counter:', self)
+        self.falling_counter = QtWidgets.QLabel('0', self)
+        self.falling_last_ts = QtWidgets.QLabel('', self)
+        # Labels updated while running are plain text, so Qt does not parse them as HTML
+        for label in [self.trigger_counter, self.rising_counter, self.rising_last_ts,
+                      self.falling_counter, self.falling_last_ts]:
+            label.setTextFormat(QtCore.Qt.PlainText)
         self.status_bar = self.statusBar()
         self.status_bar.showMessage('Status: Idle')
 
@@ -255,6 +594,16 @@ class TimeStamperApp(QtWidgets.QMainWindow):
         trigger_counter_layout.addWidget(self.label_trigger_counter)
         trigger_counter_layout.addWidget(self.trigger_counter)
         trigger_counter_layout.addStretch()
+        rising_layout = QtWidgets.QHBoxLayout()
+        rising_layout.addWidget(self.label_rising)
+        rising_layout.addWidget(self.rising_counter)
+        rising_layout.addWidget(self.rising_last_ts)
+        rising_layout.addStretch()
+        falling_layout = QtWidgets.QHBoxLayout()
+        falling_layout.addWidget(self.label_falling)
+        falling_layout.addWidget(self.falling_counter)
+        falling_layout.addWidget(self.falling_last_ts)
+        falling_layout.addStretch()
        
         # -- Add graphical widgets to main window --
         self.central_widget = QtWidgets.QWidget()
@@ -266,8 +615,8 @@ class TimeStamperApp(QtWidgets.QMainWindow):
         layout.addLayout(trigger_rate_layout)
         layout.addLayout(max_triggers_layout)
         layout.addLayout(trigger_counter_layout)
-        layout.addWidget(self.label_rising)
-        layout.addWidget(self.label_falling)
+        layout.addLayout(rising_layout)
+        layout.addLayout(falling_layout)
         layout.addStretch()
         layout.addWidget(self.button_save)
         self.central_widget.setLayout(layout)
@@ -285,10 +634,6 @@ class TimeStamperApp(QtWidgets.QMainWindow):
         else:
             self.trigger_rate.setStyleSheet('background-color: red')
     
-    def set_trigger_timer_half_interval(self, trigger_rate):
-        timer_half_interval = 0.5/trigger_rate
-        self.timer_trigger.setInterval(int(timer_half_interval * 1000))  # Convert to ms
-    
     @QtCore.Slot()
     def update_max_triggers(self):
         if self.max_triggers.text().isnumeric():
@@ -303,29 +648,29 @@ class TimeStamperApp(QtWidgets.QMainWindow):
         self.label_total_duration.setText(f'<b>Total duration:</b> {total_duration:0.1f} s')
     
     @QtCore.Slot()
-    def trigger(self):
-        self.trigger_state = not self.trigger_state
-        self.timestamper.trigger(self.trigger_state)
-        if (self.timestamper.trigger_counter >= self.max_n_triggers) and (not self.trigger_state):
+    def trigger_finished(self):
+        if self.polling:
             self.stop_polling()
-        elif self.trigger_state:
-            self.trigger_counter.setText(str(self.timestamper.trigger_counter))
+
+    @QtCore.Slot()
+    def update_trigger_counter(self):
+        self.trigger_counter.setNum(self.timestamper.trigger_counter)
     
     @QtCore.Slot()
-    def poll(self):
-        change_status = self.timestamper.poll()
-        if change_status:
-            self.counter_rising = [len(self.timestamper.timestamps_rising[ind]) for ind in self.inputs]
-            self.counter_falling = [len(self.timestamper.timestamps_falling[ind]) for ind in self.inputs]
-            #self.counter_rising = len(self.timestamper.timestamps_rising[0])
-            #self.counter_falling = len(self.timestamper.timestamps_falling[0])
-            last_ts_rising = self.timestamper.timestamps_rising[0][-1] if len(self.timestamper.timestamps_rising[0]) else ''
-            last_ts_falling = self.timestamper.timestamps_falling[0][-1] if len(self.timestamper.timestamps_falling[0]) else ''
-            self.label_rising.setText(f'Input rising counter:  {self.counter_rising[0]}' +
-                                      f'  [ {last_ts_rising} s ]')
-            self.label_falling.setText(f'Input falling counter:  {self.counter_falling[0]}' +
-                                      f'  [ {last_ts_falling} s ]')
-            
+    def update_input_counters(self):
+        counter_rising = [len(self.timestamper.timestamps_rising[ind]) for ind in self.inputs]
+        counter_falling = [len(self.timestamper.timestamps_falling[ind]) for ind in self.inputs]
+        if counter_rising != self.counter_rising:
+            self.counter_rising = counter_rising
+            self.rising_counter.setNum(counter_rising[0])
+            if counter_rising[0]:
+                self.rising_last_ts.setText(f'[ {self.timestamper.timestamps_rising[0][-1]*1e-9:0.3f} s ]')
+        if counter_falling != self.counter_falling:
+            self.counter_falling = counter_falling
+            self.falling_counter.setNum(counter_falling[0])
+            if counter_falling[0]:
+                self.falling_last_ts.setText(f'[ {self.timestamper.timestamps_falling[0][-1]*1e-9:0.3f} s ]')
+        
     def start_stop_polling(self):
         if not self.polling:
             self.start_polling()
@@ -340,9 +685,11 @@ class TimeStamperApp(QtWidgets.QMainWindow):
         #self.label_status.setText("Status: Polling...")
         #self.status_bar.showMessage(f'[Start time: {self.start_time}] Status: Polling')
         self.status_bar.showMessage(f'Status: Polling and sending trigger')
-        self.timerPoll.start()
-        self.set_trigger_timer_half_interval(float(self.trigger_rate.text()))
-        self.timer_trigger.start()
+        self.sampling_thread.start(QtCore.QThread.TimeCriticalPriority)
+        self.timer_ui.start()
+        self.trigger_thread.trigger_rate = float(self.trigger_rate.text())
+        self.trigger_thread.max_n_triggers = self.max_n_triggers
+        self.trigger_thread.start(QtCore.QThread.TimeCriticalPriority)
 
     def stop_polling(self):
         self.polling = False
@@ -352,8 +699,12 @@ class TimeStamperApp(QtWidgets.QMainWindow):
         #self.label_status.setText("Status: Idle")
         #self.status_bar.showMessage(f'[Start time: {self.start_time}] Status: Idle')
         self.status_bar.showMessage(f'Status: Idle')
-        self.timerPoll.stop()
-        self.timer_trigger.stop()
+        self.trigger_thread.stop()
+        self.sampling_thread.requestInterruption()
+        self.sampling_thread.wait()
+        self.timer_ui.stop()
+        self.update_input_counters()
+        self.update_trigger_counter()
         self.timestamper.trigger(False)
         
     def center_on_screen(self):
@@ -364,12 +715,11 @@ class TimeStamperApp(QtWidgets.QMainWindow):
 
     def save_timestamps(self):
         data = {}
-        for name in self.timestamper.input_names:
-            input_ind = self.timestamper.input_names.index(name)
-            data[f'ts_{name}_rising'] = np.array(self.timestamper.timestamps_rising[input_ind])
-            data[f'ts_{name}_falling'] = np.array(self.timestamper.timestamps_falling[input_ind])
-        data['ts_trigger_rising'] = np.array(self.timestamper.timestamps_trigger_rising)
-        data['ts_trigger_falling'] = np.array(self.timestamper.timestamps_trigger_falling)
+        for input_ind, name in enumerate(self.timestamper.input_names):
+            data[f'ts_{name}_rising'] = self.timestamper.timestamps_rising[input_ind].seconds()
+            data[f'ts_{name}_falling'] = self.timestamper.timestamps_falling[input_ind].seconds()
+        data['ts_trigger_rising'] = self.timestamper.timestamps_trigger_rising.seconds()
+        data['ts_trigger_falling'] = self.timestamper.timestamps_trigger_falling.seconds()
         data['start_time'] = self.start_time.isoformat()
 
         file_ts = self.start_time.strftime('%Y%m%d_%H%M%S')
@@ -400,6 +750,8 @@ class TimeStamperApp(QtWidgets.QMainWindow):
     def closeEvent(self, event):
         self.settings.setValue('geometry', self.saveGeometry())
         self.settings.sync()
+        if self.polling:
+            self.stop_polling()
         self.timestamper.device.close()
         event.accept()
 
@@ -411,10 +763,11 @@ if __name__ == '__main__':
         
 if __name__ == "__main__":
     app = QtWidgets.QApplication(sys.argv)
+    streaming = '--poll' not in app.arguments()
     if '--dummy' in app.arguments():
-        tsApp = TimeStamperApp(dummy=True)
+        tsApp = TimeStamperApp(dummy=True, streaming=streaming)
     else:
-        tsApp = TimeStamperApp()
+        tsApp = TimeStamperApp(streaming=streaming)
     tsApp.show()
     sys.exit(app.exec_())
 